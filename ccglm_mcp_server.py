@@ -5,31 +5,58 @@ Rutea prompts a GLM vía Claude CLI con configuración Z.AI
 """
 
 import asyncio
+import atexit
+import codecs
+import io
+import itertools
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import re
 import sys
 import subprocess
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime
 import shlex
-from dotenv import load_dotenv
 
-import mcp.server.stdio
+try:
+    from asyncio import timeout as async_timeout  # Python 3.11+
+except ImportError:
+    from async_timeout import timeout as async_timeout
+
+# uvloop opcional: event loop en C, más rápido para subprocess y pipes
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 import mcp.types as types
 from mcp.server import Server
 
-# Cargar variables de entorno desde .env
-load_dotenv()
+# Cargar variables de entorno desde .env (CCGLM_MCP_NO_DOTENV=1 lo omite si el entorno ya está completo)
+if os.getenv("CCGLM_MCP_NO_DOTENV") != "1":
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # CRÍTICO: Usar stderr para logs, NO stdout (patrón de CCR-MCP)
-logging.basicConfig(
-    level=logging.INFO,
-    stream=sys.stderr,  # ✅ stderr para no interferir con stdio
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+_stderr_handler = logging.StreamHandler(sys.stderr)  # ✅ stderr para no interferir con stdio
+_stderr_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+# Los logs se encolan y un thread los escribe, sin bloquear el event loop
+_log_queue = queue.Queue(-1)
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # el formato final lo aplica el listener
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = logging.handlers.QueueListener(_log_queue, _stderr_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logger = logging.getLogger("ccglm-mcp")
 
 # Crear servidor MCP
@@ -39,118 +66,456 @@ server = Server("ccglm-mcp")
 DEFAULT_TIMEOUT = 300  # 4.6 minutos (un poco menos que Claude)
 MAX_TIMEOUT = 600      # 4.9 minutos (margen de seguridad)
 
+# Snapshot del entorno: una sola copia de os.environ para toda la configuración
+_ENV = os.environ.copy()
+
+# Configuración desde variables de entorno, leída una sola vez
+CONFIG = SimpleNamespace(
+    glm_base_url=_ENV.get("GLM_BASE_URL", "https://api.z.ai/api/anthropic"),
+    glm_auth_token=_ENV.get("GLM_AUTH_TOKEN"),
+    # Forzar el escaneo del sistema de archivos aunque la salida liste los archivos escritos
+    verify_fs=_ENV.get("CCGLM_VERIFY_FS", "0") == "1",
+    # Valor por defecto del argumento track_files: "true", "false" o "auto" (heurística)
+    track_files={"true": True, "false": False}.get(_ENV.get("CCGLM_MCP_TRACK_FILES", "auto").lower()),
+)
+
 # Configuración GLM desde variables de entorno
-GLM_BASE_URL = os.getenv("GLM_BASE_URL", "https://api.z.ai/api/anthropic")
-GLM_AUTH_TOKEN = os.getenv("GLM_AUTH_TOKEN")
+GLM_BASE_URL = CONFIG.glm_base_url
+GLM_AUTH_TOKEN = CONFIG.glm_auth_token
 
 # Validar configuración
 if not GLM_AUTH_TOKEN:
     logger.error("❌ GLM_AUTH_TOKEN no configurado")
     sys.exit(1)
 
-def get_current_files(directory: str = ".") -> Set[str]:
-    """Obtener conjunto de archivos actuales en el directorio"""
+# Environment del subprocess con credenciales GLM, calculado una sola vez
+_BASE_CHILD_ENV = _ENV.copy()
+_BASE_CHILD_ENV["ANTHROPIC_BASE_URL"] = GLM_BASE_URL
+_BASE_CHILD_ENV["ANTHROPIC_AUTH_TOKEN"] = GLM_AUTH_TOKEN
+
+def build_child_env(model: str) -> Dict[str, str]:
+    """Construir el environment del subprocess Claude CLI para un modelo"""
+    env = _BASE_CHILD_ENV.copy()
+    env["ANTHROPIC_MODEL"] = model
+    return env
+
+# Environments precalculados para los modelos soportados
+_CHILD_ENVS = {model: build_child_env(model) for model in ("glm-4.6", "glm-4.5-air")}
+
+# Comando Claude CLI con flags requeridos
+CLAUDE_CMD = ["claude", "--dangerously-skip-permissions", "-c", "-p"]
+_CLAUDE_CMD_STR = " ".join(CLAUDE_CMD)
+
+# Bytes finales de stderr retenidos en memoria (solo se usan para previews y mensajes de error)
+STDERR_CAPTURE_LIMIT = 4096
+
+VERIFY_FS = CONFIG.verify_fs
+
+# Directorio de trabajo del servidor: nunca hace chdir, así que basta leerlo una vez
+_CWD = os.getcwd()
+
+# Directorios internos excluidos del tracking de archivos
+_EXCLUDED_DIRS = frozenset({'.claude', '.git', 'node_modules', '__pycache__', '.venv', '.next', 'dist', 'build'})
+
+# Caché LRU por directorio: path -> (mtime_ns, subdirectorios, archivos, recorrido)
+_dir_cache: "OrderedDict[str, Tuple[int, Tuple[str, ...], Tuple[str, ...], int]]" = OrderedDict()
+_DIR_CACHE_MAX_ENTRIES = 20000  # Acota la memoria con varios cwd o árboles muy grandes
+
+# Número de recorrido: cada recorrido visita los directorios en el mismo orden,
+# así que con un árbol mayor que la caché un LRU puro expulsaría justo lo que el
+# siguiente recorrido lee primero. Nunca se expulsa lo tocado en el recorrido actual
+_walk_generations = itertools.count(1)
+
+# Directorios modificados hace menos de esto no se cachean: un cambio dentro
+# del mismo tick de mtime no sería visible (2s cubre también FAT)
+_RACY_MTIME_NS = 2_000_000_000
+
+def _list_dir(path: str, mtime_ns: int, use_cache: bool = True,
+              generation: int = 0) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Listar subdirectorios y archivos de path, reutilizando la caché si su mtime no cambió"""
+    if use_cache:
+        cached = _dir_cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            try:
+                if cached[3] < generation:
+                    _dir_cache[path] = cached[:3] + (generation,)
+                _dir_cache.move_to_end(path)
+            except KeyError:
+                pass  # Expulsada por otro thread entre get y move_to_end
+            return cached[1], cached[2]
+    else:
+        cached = None
+
+    # Al releer un directorio cambiado, las rutas sin cambios reutilizan el
+    # objeto (y su hash) de la entrada anterior, que se expulsa con ella
+    known = {p: p for p in cached[2]} if cached is not None else {}
+    subdirs = []
+    files = []
+    # os.scandir reutiliza el tipo de entrada devuelto por readdir (sin stat extra)
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    # Igual que os.walk: no seguir symlinks a directorios
+                    if entry.name not in _EXCLUDED_DIRS and not entry.is_symlink():
+                        subdirs.append(entry.path)
+                else:
+                    file_path = entry.path
+                    files.append(known.get(file_path, file_path))
+            except OSError:
+                continue
+
+    # Tuplas inmutables: los llamadores comparten la entrada sin copiarla
+    subdirs = tuple(subdirs)
+    files = tuple(files)
+    # Solo se guarda si el directorio no cambió durante el listado: si no, la
+    # entrada quedaría asociada a un mtime anterior a su contenido
+    if time.time_ns() - mtime_ns > _RACY_MTIME_NS and _dir_mtime_ns(path) == mtime_ns:
+        _store_dir(path, (mtime_ns, subdirs, files, generation))
+    return subdirs, files
+
+def _dir_mtime_ns(path: str) -> Optional[int]:
+    """mtime actual de un directorio, o None si ya no existe"""
     try:
-        files = set()
-        for root, dirs, filenames in os.walk(directory):
-            # Excluir directorios internos
-            dirs[:] = [d for d in dirs if d not in {'.claude', '.git', 'node_modules', '__pycache__', '.venv', '.next', 'dist', 'build'}]
-            for filename in filenames:
-                files.add(os.path.join(root, filename))
-        return files
-    except Exception as e:
-        logger.warning(f"Error scanning directory {directory}: {e}")
-        return set()
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _store_dir(path: str, entry: Tuple[int, Tuple[str, ...], Tuple[str, ...], int]) -> None:
+    """Guardar el listado de un directorio, expulsando solo entradas de recorridos anteriores"""
+    if path not in _dir_cache:
+        while len(_dir_cache) >= _DIR_CACHE_MAX_ENTRIES:
+            try:
+                oldest_path, oldest = next(iter(_dir_cache.items()))
+            except (StopIteration, RuntimeError):
+                break  # Vacía, o modificada por otro thread
+            if oldest[3] >= entry[3]:
+                # Todo lo cacheado se usa en este recorrido: no se cachea más
+                return
+            _dir_cache.pop(oldest_path, None)
+    _dir_cache[path] = entry
+    try:
+        _dir_cache.move_to_end(path)
+    except KeyError:
+        pass  # Expulsada por otro thread
+
+def get_current_files(directory: str = ".", use_cache: bool = True) -> Set[str]:
+    """Obtener conjunto de archivos actuales en el directorio
+
+    Los directorios cuyo mtime no cambió se resuelven desde la caché sin
+    llamar a os.scandir: crear, borrar o renombrar una entrada actualiza el
+    mtime del directorio que la contiene.
+    """
+    files = set()
+    generation = next(_walk_generations)
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            subdirs, dir_files = _list_dir(current, os.stat(current).st_mtime_ns, use_cache, generation)
+        except OSError as e:
+            if current == directory:
+                logger.warning("Error scanning directory %s: %s", directory, e)
+            continue
+        stack.extend(subdirs)
+        files.update(dir_files)
+    return files
+
+def snapshot_dir_listings(directory: str, since_ns: int) -> Dict[str, Tuple[str, ...]]:
+    """Listado previo a since_ns de cada directorio, para scan_new_files_since
+
+    Puede ejecutarse mientras el proceso ya escribe: solo se incluyen los
+    directorios cuyo mtime es anterior a since_ns y no cambió durante el
+    listado, así un archivo creado antes de que el recorrido llegue a su
+    directorio no se toma por preexistente.
+    """
+    listings = {}
+    generation = next(_walk_generations)
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            dir_mtime = os.stat(current).st_mtime_ns
+            subdirs, dir_files = _list_dir(current, dir_mtime, generation=generation)
+        except OSError:
+            continue
+        stack.extend(subdirs)
+        if dir_mtime < since_ns and _dir_mtime_ns(current) == dir_mtime:
+            listings[current] = dir_files
+    return listings
+
+def scan_new_files_since(directory: str, since_ns: int,
+                         before: Optional[Dict[str, Tuple[str, ...]]] = None) -> Dict[str, int]:
+    """Obtener archivos creados desde since_ns con su tamaño
+
+    Solo se revisan los directorios cuyo mtime cambió desde since_ns: crear o
+    renombrar una entrada actualiza el mtime del directorio. Los directorios
+    sin cambios se listan desde la caché de _list_dir.
+
+    Los archivos que ya existían (editados en el sitio o reescritos) no se
+    cuentan: se descartan los del listado previo del directorio en `before`
+    (ver snapshot_dir_listings) o, si no está, los del listado en caché
+    anterior a since_ns. Si un directorio no tiene listado previo, se usa el
+    mtime del archivo.
+    """
+    new_files = {}
+    generation = next(_walk_generations)
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            dir_mtime = os.stat(current).st_mtime_ns
+            existing = None
+            if dir_mtime >= since_ns:
+                listing = before.get(current) if before is not None else None
+                if listing is None:
+                    # Listado previo a la ejecución, antes de que _list_dir lo reemplace
+                    cached = _dir_cache.get(current)
+                    if cached is not None and cached[0] < since_ns:
+                        listing = cached[2]
+                if listing is not None:
+                    existing = frozenset(listing)
+            subdirs, dir_files = _list_dir(current, dir_mtime, generation=generation)
+        except OSError as e:
+            if current == directory:
+                logger.warning("Error scanning directory %s: %s", directory, e)
+            continue
+        stack.extend(subdirs)
+        if dir_mtime >= since_ns:
+            for path in dir_files:
+                if existing is not None and path in existing:
+                    continue
+                try:
+                    stat = os.stat(path, follow_symlinks=False)
+                except OSError:
+                    continue
+                # Con listado previo, lo que no estaba es nuevo aunque conserve
+                # un mtime antiguo (p. ej. movido dentro del directorio)
+                if existing is not None or stat.st_mtime_ns >= since_ns:
+                    new_files[path] = stat.st_size
+    return new_files
+
+# Indicios en la salida de Claude CLI de que se crearon o escribieron archivos
+_FILE_ACTIVITY_RE = re.compile(
+    r'(?i)write\(|edit\(|creat|cread|wrote|written|saved|guard|escrib|escrit|archivo|file'
+)
+
+# Indicios en el prompt de que la tarea puede crear o escribir archivos
+_PROMPT_WANTS_FILES = re.compile(
+    r'(?i)\b(?:creat|write|generat|save|crea|escrib|gener[ae]|guard|archivo|file)|```'
+)
+
+def prompt_wants_files(prompt: str) -> bool:
+    """Detectar si el prompt pide crear o escribir archivos"""
+    return _PROMPT_WANTS_FILES.search(prompt) is not None
+
+def output_mentions_files(*outputs: str) -> bool:
+    """Detectar si la salida sugiere actividad sobre archivos"""
+    return any(_FILE_ACTIVITY_RE.search(output) for output in outputs if output)
+
+# Llamadas a la herramienta Write de Claude CLI: Write(path) o Write(file_path="path")
+_WRITE_TOOL_RE = re.compile(r'\bWrite\((?:file_path=)?["\']?([^"\'()\r\n]+?)["\']?\)')
+
+def files_from_tool_output(directory: str, since_ns: int, *outputs: str) -> Dict[str, int]:
+    """Obtener los archivos escritos según las llamadas Write de la salida, con su tamaño
+
+    La salida del modelo no es fiable por sí sola: solo se aceptan rutas dentro
+    de directory cuyo mtime es posterior a since_ns.
+    """
+    prefix = os.path.join(directory, "")
+    written = {}
+    for output in outputs:
+        if not output or "Write(" not in output:
+            continue
+        for raw_path in _WRITE_TOOL_RE.findall(output):
+            path = os.path.abspath(os.path.join(directory, raw_path.strip()))
+            if path in written or not path.startswith(prefix):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_mtime_ns >= since_ns:
+                written[path] = stat.st_size
+    return written
 
 def detect_new_files(before: Set[str], after: Set[str]) -> List[str]:
     """Detectar archivos nuevos comparando dos sets"""
-    new_files = after - before
-    return sorted(list(new_files))
+    return sorted(after - before)
 
-def format_file_summary(new_files: List[str], stdout_text: str) -> str:
-    """Formatear resumen de archivos creados"""
+def format_file_summary(new_files: List[str], stdout_text: str,
+                        file_sizes: Optional[Dict[str, int]] = None) -> str:
+    """Formatear resumen de archivos creados (tamaños ya conocidos en file_sizes)"""
     if not new_files:
         return stdout_text
 
-    # Crear resumen de archivos creados
-    summary_lines = [
-        f"✅ GLM execution completed successfully!",
-        f"📁 {len(new_files)} files created:"
-    ]
+    # Crear resumen de archivos creados, escribiendo directamente en un buffer
+    buf = io.StringIO()
+    write = buf.write
+    write("✅ GLM execution completed successfully!\n")
+    write(f"📁 {len(new_files)} files created:")
 
     for file_path in new_files[:10]:  # Limitar a primeros 10 archivos
-        try:
-            file_size = os.path.getsize(file_path)
-            summary_lines.append(f"  • {file_path} ({file_size} bytes)")
-        except:
-            summary_lines.append(f"  • {file_path}")
+        file_size = file_sizes.get(file_path) if file_sizes else None
+        if file_size is None:
+            try:
+                file_size = os.path.getsize(file_path)
+            except OSError:
+                write(f"\n  • {file_path}")
+                continue
+        write(f"\n  • {file_path} ({file_size} bytes)")
 
     if len(new_files) > 10:
-        summary_lines.append(f"  ... and {len(new_files) - 10} more files")
+        write(f"\n  ... and {len(new_files) - 10} more files")
 
     # Agregar el output original si existe y es relevante
     if stdout_text and len(stdout_text.strip()) > 0:
-        summary_lines.extend([
-            "",
-            "📝 Original output:",
-            stdout_text
-        ])
+        write("\n\n📝 Original output:\n")
+        write(stdout_text)
+
+    return buf.getvalue()
+
+def sanitize_for_log(text: str) -> str:
+    """Sanitizar datos sensibles de los logs"""
+    # `in` no reserva memoria: solo se copia el texto cuando contiene el token
+    if not GLM_AUTH_TOKEN or GLM_AUTH_TOKEN not in text:
+        return text
+    return text.replace(GLM_AUTH_TOKEN, "***REDACTED***")
+
+# Token precodificado para sanitizar la salida cruda del subprocess
+_AUTH_TOKEN_BYTES = GLM_AUTH_TOKEN.encode('utf-8') if GLM_AUTH_TOKEN else None
+
+def sanitize_bytes(data: bytes) -> bytes:
+    """Sanitizar datos sensibles en bytes, antes de decodificar"""
+    if not _AUTH_TOKEN_BYTES or _AUTH_TOKEN_BYTES not in data:
+        return data
+    return data.replace(_AUTH_TOKEN_BYTES, b"***REDACTED***")
+
+# Rangos Unicode de caracteres chinos comunes, compilados en una sola clase
+_CJK_RE = re.compile(
+    '['
+    '\u4e00-\u9fff'           # CJK Unified Ideographs
+    '\u3400-\u4dbf'           # CJK Extension A
+    '\U00020000-\U0002a6df'   # CJK Extension B
+    '\U0002a700-\U0002ebef'   # CJK Extensions C, D, E y F
+    '\u3000-\u303f'           # CJK Symbols and Punctuation
+    '\uff00-\uffef'           # Halfwidth and Fullwidth Forms
+    ']'
+)
 
-    return "\n".join(summary_lines)
+# Bytes iniciales UTF-8 de esos rangos (U+3000-U+9FFF -> E3-E9, U+FFxx -> EF,
+# extensiones B-F -> F0); si no aparecen, el texto no puede contener CJK
+_CJK_LEAD_RE = re.compile(rb'[\xe3-\xe9\xef\xf0]')
 
 def contains_chinese(text: str) -> bool:
     """Detectar si el texto contiene caracteres chinos"""
-    try:
-        # Verificar rangos Unicode de caracteres chinos comunes
-        for char in text:
-            code = ord(char)
-            if (0x4E00 <= code <= 0x9FFF or  # CJK Unified Ideographs
-                0x3400 <= code <= 0x4DBF or  # CJK Extension A
-                0x20000 <= code <= 0x2A6DF or  # CJK Extension B
-                0x2A700 <= code <= 0x2B73F or  # CJK Extension C
-                0x2B740 <= code <= 0x2B81F or  # CJK Extension D
-                0x2B820 <= code <= 0x2CEAF or  # CJK Extension E
-                0x2CEB0 <= code <= 0x2EBEF or  # CJK Extension F
-                0x3000 <= code <= 0x303F or    # CJK Symbols and Punctuation
-                0xFF00 <= code <= 0xFFEF):     # Halfwidth and Fullwidth Forms
-                return True
+    # Prompts ASCII (el caso habitual): isascii lee un flag del str, sin recorrerlo
+    if text.isascii():
         return False
-    except Exception:
+    # Pre-filtro sobre bytes: descarta en una pasada en C los prompts sin CJK
+    if _CJK_LEAD_RE.search(text.encode('utf-8', 'surrogatepass')) is None:
         return False
+    # El motor de regex recorre el texto en C y se detiene en la primera coincidencia
+    return _CJK_RE.search(text) is not None
+
+def _token_prefix_len(data: bytes) -> int:
+    """Longitud del mayor final de data que es prefijo (incompleto) del token"""
+    if not _AUTH_TOKEN_BYTES:
+        return 0
+    for k in range(min(len(_AUTH_TOKEN_BYTES) - 1, len(data)), 0, -1):
+        if data.endswith(_AUTH_TOKEN_BYTES[:k]):
+            return k
+    return 0
+
+async def read_stream_tail(stream: asyncio.StreamReader, limit: int) -> bytes:
+    """Leer un stream hasta EOF y devolver sus últimos `limit` bytes, ya sanitizados
+
+    Se sanitiza antes de recortar: un token partido entre bloques o por el
+    recorte nunca llega a la salida. Se conserva el final porque el error
+    real del CLI aparece al final de su salida.
+    """
+    tail = bytearray()
+    pending = b""  # Final del bloque anterior que podría ser el inicio del token
+    while True:
+        chunk = await stream.read(65536)  # Tamaño típico del buffer de un pipe en Linux
+        if not chunk:
+            break
+        data = sanitize_bytes(pending + chunk)
+        keep = _token_prefix_len(data)
+        pending = data[len(data) - keep:] if keep else b""
+        tail += data[:len(data) - keep]
+        if len(tail) > limit:
+            # Se sigue leyendo para que el proceso no se bloquee
+            del tail[:len(tail) - limit]
+    tail += pending
+    return bytes(tail[-limit:])
+
+async def write_stream(stream: asyncio.StreamWriter, data: bytes) -> None:
+    """Escribir data en el stdin del proceso respetando el flow control y cerrarlo"""
+    try:
+        stream.write(data)
+        await stream.drain()
+        stream.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # El proceso terminó antes de leer stdin; su salida explica por qué
+
+async def read_text_stream(stream: asyncio.StreamReader) -> str:
+    """Leer un stream hasta EOF decodificando UTF-8 por bloques
+
+    El decoder incremental respeta los caracteres partidos entre bloques y
+    evita retener la salida completa en bytes además de en str.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    parts = []
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+# Definición de herramientas, inmutable: se construye una sola vez
+_TOOLS = [
+    types.Tool(
+        name="ccglm",
+        description="Route prompt to GLM-4.6 (default) or glm-4.5-air (fast) via Claude CLI with Z.AI credentials",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "prompt": {
+                    "type": "string",
+                    "description": "Prompt to send to GLM"
+                },
+                "model": {
+                    "type": "string",
+                    "description": "GLM model to use (glm-4.6 or glm-4.5-air)",
+                    "default": "glm-4.6",
+                    "enum": ["glm-4.6", "glm-4.5-air"]
+                },
+                "track_files": {
+                    "type": "boolean",
+                    "description": "Report files created by GLM (default: CCGLM_MCP_TRACK_FILES, or detected from the prompt and output)"
+                }
+            },
+            "required": ["prompt"]
+        }
+    )
+]
 
 @server.list_tools()
 async def list_tools() -> List[types.Tool]:
     """Listar herramientas disponibles"""
-    return [
-        types.Tool(
-            name="ccglm",
-            description="Route prompt to GLM-4.6 (default) or glm-4.5-air (fast) via Claude CLI with Z.AI credentials",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "prompt": {
-                        "type": "string",
-                        "description": "Prompt to send to GLM"
-                    },
-                    "model": {
-                        "type": "string",
-                        "description": "GLM model to use (glm-4.6 or glm-4.5-air)",
-                        "default": "glm-4.6",
-                        "enum": ["glm-4.6", "glm-4.5-air"]
-                    }
-                },
-                "required": ["prompt"]
-            }
-        )
-    ]
+    return _TOOLS
 
 @server.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
     """Ejecutar herramienta"""
-    start_time = time.time()
-
     try:
-        if name == "ccglm":
+        handler = _TOOL_HANDLERS.get(name)
+        if handler is None:
+            result = {"error": f"Unknown tool: {name}"}
+        else:
             prompt = arguments.get("prompt", "")
 
             # VALIDACIÓN DE IDIOMA
@@ -163,9 +528,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextCont
                 )
                 return [types.TextContent(type="text", text=error_msg)]
 
-            result = await ccglm_route(arguments)
-        else:
-            result = {"error": f"Unknown tool: {name}"}
+            result = await handler(arguments)
 
         # Formatear respuesta
         if isinstance(result, dict):
@@ -179,7 +542,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextCont
         return [types.TextContent(type="text", text=response)]
 
     except Exception as e:
-        logger.error(f"Tool execution failed: {e}", exc_info=True)
+        logger.error("Tool execution failed: %s", e, exc_info=True)
         return [types.TextContent(
             type="text",
             text=f"❌ Error executing {name}: {str(e)}"
@@ -188,48 +551,52 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextCont
 async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
     """Route prompt to GLM via Claude CLI con Z.AI credentials"""
     prompt = args.get("prompt", "")
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()  # Monotónico: inmune a ajustes del reloj
 
     if not prompt:
         logger.error("No prompt provided in ccglm request")
         return {"error": "No prompt provided"}
 
+    prime_task = None
     try:
-        # Logging básico
-        prompt_preview = prompt[:200] if len(prompt) > 200 else prompt
-        logger.info(f"🚀 Starting GLM routing - Prompt length: {len(prompt)} chars")
-        logger.info(f"📝 Prompt preview: {prompt_preview}...")
-
-        # Capturar archivos antes de la ejecución
-        cwd = os.getcwd()
-        logger.info(f"📁 Working directory: {cwd}")
-        files_before = get_current_files(cwd)
-        logger.info(f"📊 Files before execution: {len(files_before)}")
-
-        # Preparar environment con credenciales GLM
-        env = os.environ.copy()
-        env["ANTHROPIC_BASE_URL"] = GLM_BASE_URL
-        env["ANTHROPIC_AUTH_TOKEN"] = GLM_AUTH_TOKEN
-
-        # Seleccionar modelo
+        # Logging básico (la preview solo se corta si el nivel INFO está activo)
+        log_info = logger.isEnabledFor(logging.INFO)
+        cwd = _CWD
+        if log_info:
+            logger.info("🚀 Starting GLM routing - Prompt length: %d chars", len(prompt))
+            # Sanitizar antes de cortar: un token partido en el corte no se detectaría
+            logger.info("📝 Prompt preview: %s...", sanitize_for_log(prompt)[:200])
+            logger.info("📁 Working directory: %s", cwd)
+
+        # Codificar el prompt una sola vez antes de lanzar el proceso
+        prompt_bytes = prompt.encode('utf-8')
+
+        # Seleccionar modelo y su environment con credenciales GLM
         model = args.get("model", "glm-4.6")
-        env["ANTHROPIC_MODEL"] = model
+        env = _CHILD_ENVS.get(model) or build_child_env(model)
 
         # Determinar timeout basado en modelo
         model_timeout = 120 if model == "glm-4.5-air" else DEFAULT_TIMEOUT
         effective_timeout = min(model_timeout, MAX_TIMEOUT)
 
-        logger.info(f"🎯 Using GLM model: {model} (timeout: {effective_timeout}s)")
-        logger.info(f"🔧 GLM endpoint: {GLM_BASE_URL}")
+        logger.info("🎯 Using GLM model: %s (timeout: %ss, endpoint: %s)", model, effective_timeout, GLM_BASE_URL)
 
-        # Comando Claude CLI con flags requeridos
-        cmd = ["claude", "--dangerously-skip-permissions", "-c", "-p"]
-        logger.info(f"💻 Executing command: {' '.join(cmd)}")
+        logger.info("💻 Executing command: %s", _CLAUDE_CMD_STR)
 
         # Crear proceso con comunicación stdin (patrón CCR-MCP)
         logger.info("🔄 Creating subprocess for GLM communication")
+        # Marca temporal para detectar archivos nuevos sin escanear antes
+        since_ns = time.time_ns()
+        track_files = args.get("track_files", CONFIG.track_files)
+        # Escaneo seguro antes de ejecutar: forzado o pedido por el prompt. Si
+        # solo lo sugiere la salida se decide después, sin recorrido previo
+        scan_planned = track_files is not False and (VERIFY_FS or track_files or prompt_wants_files(prompt))
+        if scan_planned:
+            # Listar el árbol en un thread mientras GLM trabaja: da el listado
+            # previo y deja en caché los directorios que no cambien
+            prime_task = asyncio.create_task(asyncio.to_thread(snapshot_dir_listings, cwd, since_ns))
         process = await asyncio.create_subprocess_exec(
-            *cmd,
+            *CLAUDE_CMD,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
             stdin=asyncio.subprocess.PIPE,
@@ -238,18 +605,23 @@ async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
 
         try:
             # Enviar prompt por stdin y capturar salida
-            logger.info(f"📤 Sending prompt via stdin (timeout: {effective_timeout}s)")
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(input=prompt.encode('utf-8')),
-                timeout=effective_timeout
-            )
+            logger.info("📤 Sending prompt via stdin (timeout: %ss)", effective_timeout)
+            async with async_timeout(effective_timeout):
+                # stdin, stdout y stderr en paralelo: un prompt grande no llena
+                # el pipe mientras el proceso espera a que leamos su salida
+                stdout, stderr, _ = await asyncio.gather(
+                    read_text_stream(process.stdout),
+                    read_stream_tail(process.stderr, STDERR_CAPTURE_LIMIT),
+                    write_stream(process.stdin, prompt_bytes)
+                )
+                await process.wait()
 
-            execution_time = time.time() - start_time
-            logger.info(f"⏱️  GLM execution completed in {execution_time:.2f}s")
+            execution_time = (time.perf_counter_ns() - start_ns) / 1e9
+            logger.info("⏱️  GLM execution completed in %.2fs", execution_time)
 
         except asyncio.TimeoutError:
-            execution_time = time.time() - start_time
-            logger.warning(f"⏰ GLM process timed out after {effective_timeout}s (execution time: {execution_time:.2f}s)")
+            execution_time = (time.perf_counter_ns() - start_ns) / 1e9
+            logger.warning("⏰ GLM process timed out after %ss (execution time: %.2fs)", effective_timeout, execution_time)
 
             # Terminar proceso
             try:
@@ -263,69 +635,106 @@ async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
 
             return {"error": f"Request timed out after {effective_timeout}s for model {model}"}
 
-        # Decodificar salidas
-        stdout_text = stdout.decode('utf-8', errors='replace').strip()
-        stderr_text = stderr.decode('utf-8', errors='replace').strip()
+        # stdout ya llega decodificado; stderr llega acotado y sanitizado
+        stdout_text = stdout.strip()
+        stderr_text = stderr.strip().decode('utf-8', errors='replace')
 
         # Logging del resultado
-        logger.info(f"📊 GLM process results:")
-        logger.info(f"  • Exit code: {process.returncode}")
-        logger.info(f"  • Stdout length: {len(stdout_text)} chars")
-        logger.info(f"  • Stderr length: {len(stderr_text)} chars")
+        logger.info(
+            "📊 GLM process results: exit code %s, stdout %d chars, stderr %d chars",
+            process.returncode, len(stdout_text), len(stderr_text)
+        )
 
         if stderr_text:
-            stderr_preview = stderr_text[:500] if len(stderr_text) > 500 else stderr_text
-            logger.info(f"⚠️  Stderr content: {stderr_preview}...")
-
-        # Capturar archivos después de la ejecución
-        files_after = get_current_files(cwd)
-        new_files = detect_new_files(files_before, files_after)
-        logger.info(f"📁 Files after execution: {len(files_after)} total, {len(new_files)} new")
-
-        if new_files:
-            logger.info("✨ New files created:")
-            for file_path in new_files[:5]:  # Log primeros 5 archivos
-                try:
-                    file_size = os.path.getsize(file_path)
-                    logger.info(f"  • {file_path} ({file_size} bytes)")
-                except:
-                    logger.info(f"  • {file_path}")
+            # %.500s corta la preview al formatear, solo si el registro se emite
+            logger.info("⚠️  Stderr content: %.500s...", stderr_text)
+
+        # Capturar archivos creados: primero desde las llamadas Write de la salida,
+        # y escaneando el directorio solo si el prompt o la salida sugieren actividad
+        reported_files = files_from_tool_output(cwd, since_ns, stdout_text, stderr_text) if track_files is not False else {}
+        if track_files is False:
+            file_sizes = {}
+            new_files = []
+            logger.info("📁 File tracking disabled by request")
+        elif reported_files and not VERIFY_FS:
+            file_sizes = reported_files
+            new_files = sorted(file_sizes)
+            logger.info("📁 Files written according to tool output: %d", len(new_files))
+        elif scan_planned or output_mentions_files(stdout_text, stderr_text):
+            before = await prime_task if prime_task is not None else None
+            # Escaneo fuera del event loop: el resto de peticiones sigue avanzando
+            file_sizes = await asyncio.to_thread(scan_new_files_since, cwd, since_ns, before)
+            new_files = sorted(file_sizes)
+            logger.info("📁 Files created during execution: %d", len(new_files))
+        else:
+            file_sizes = {}
+            new_files = []
+            logger.info("📁 Prompt and output do not mention files, skipping file scan")
+
+        if new_files and log_info:
+            # Un único registro con los primeros 5 archivos
+            file_lines = []
+            for file_path in new_files[:5]:
+                # Tamaños ya obtenidos por el escaneo o por el stat de la salida
+                file_size = file_sizes.get(file_path)
+                if file_size is None:
+                    file_lines.append(f"  • {file_path}")
+                else:
+                    file_lines.append(f"  • {file_path} ({file_size} bytes)")
             if len(new_files) > 5:
-                logger.info(f"  ... and {len(new_files) - 5} more files")
+                file_lines.append(f"  ... and {len(new_files) - 5} more files")
+            logger.info("✨ New files created:\n%s", "\n".join(file_lines))
 
         # Manejo de códigos de salida
         if process.returncode != 0:
             if stdout_text and len(stdout_text) > 10:
-                logger.warning(f"⚠️  GLM returned error code {process.returncode} but has output ({len(stdout_text)} chars)")
+                logger.warning("⚠️  GLM returned error code %s but has output (%d chars)", process.returncode, len(stdout_text))
             elif new_files:
-                logger.warning(f"⚠️  GLM returned error code {process.returncode} but created {len(new_files)} files")
+                logger.warning("⚠️  GLM returned error code %s but created %d files", process.returncode, len(new_files))
             else:
                 error_msg = stderr_text or f"GLM exited with code {process.returncode}"
-                logger.error(f"❌ GLM command failed: {error_msg}")
+                logger.error("❌ GLM command failed: %s", error_msg)
                 return {"error": f"GLM failed: {error_msg}"}
 
         # Formatear respuesta
         if new_files:
-            response_text = format_file_summary(new_files, stdout_text)
+            response_text = format_file_summary(new_files, stdout_text, file_sizes)
         elif stdout_text:
             response_text = stdout_text
         else:
             response_text = "GLM execution completed (no output or files created)"
 
-        logger.info(f"✅ GLM routing completed successfully in {execution_time:.2f}s")
+        logger.info("✅ GLM routing completed successfully in %.2fs", execution_time)
         return {"response": response_text}
 
     except Exception as e:
-        execution_time = time.time() - start_time
-        logger.error(f"💥 GLM routing failed after {execution_time:.2f}s: {e}", exc_info=True)
-        return {"error": f"Unexpected error: {str(e)}"}
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
+        error_msg = sanitize_for_log(str(e))
+        logger.error("💥 GLM routing failed after %.2fs: %s", execution_time, error_msg, exc_info=True)
+        return {"error": f"Unexpected error: {error_msg}"}
+
+    finally:
+        # Timeout, error o sin escaneo: no dejar el recorrido previo huérfano
+        if prime_task is not None:
+            if not prime_task.done():
+                prime_task.cancel()
+            elif not prime_task.cancelled():
+                prime_task.exception()  # Marcar su posible excepción como observada
+
+# Tabla de despacho: nombre de herramienta -> handler
+_TOOL_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    "ccglm": ccglm_route,
+}
 
 async def main():
     """Main entry point"""
     logger.info("CCGLM MCP Server starting (simplified version)...")
     logger.info("GLM routing mode - routes prompts via Claude CLI to Z.AI GLM backend")
-    logger.info(f"GLM endpoint: {GLM_BASE_URL}")
-    logger.info(f"Timeouts - Default: {DEFAULT_TIMEOUT}s, Max: {MAX_TIMEOUT}s")
+    logger.info("GLM endpoint: %s", CONFIG.glm_base_url)
+    logger.info("Timeouts - Default: %ss, Max: %ss", DEFAULT_TIMEOUT, MAX_TIMEOUT)
+
+    # Transporte stdio importado aquí: solo lo necesita el servidor en ejecución
+    import mcp.server.stdio
 
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         logger.info("Server ready, waiting for connections...")
@@ -336,10 +745,12 @@ async def main():
         )
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Server shutdown by user")
     except Exception as e:
-        logger.error(f"Server error: {e}")
+        logger.error("Server error: %s", e)
         sys.exit(1)
@@ -17,16 +17,21 @@ import fcntl
 import atexit
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Set
-from datetime import datetime
 import shlex
 from dotenv import load_dotenv
 
+# orjson opcional: serialización en C para el fallback de respuestas
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import mcp.server.stdio
 import mcp.types as types
 from mcp.server import Server
 
 # Import enhanced logging utilities
-from logging_utils import get_logger
+from logging_utils import encode_and_hash, get_logger
 
 # Initialize enhanced logger (replaces basic logging setup)
 ccglm_logger = get_logger()
@@ -38,6 +43,12 @@ load_dotenv()
 # Crear servidor MCP
 server = Server("ccglm-mcp")
 
+def dumps_result(result: Dict[str, Any]) -> str:
+    """Serializar un resultado como JSON indentado (orjson si está disponible)"""
+    if orjson is not None:
+        return orjson.dumps(result, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
 # Configuración de timeouts sincronizada con Claude Code (300s)
 DEFAULT_TIMEOUT = 280    # 4.6 minutos (un poco menos que Claude para evitar race conditions)
 MAX_TIMEOUT = 295        # 4.9 minutos (margen de seguridad antes del timeout de Claude)
@@ -65,6 +76,9 @@ _file_cache = {
     "directory": ""
 }
 
+# Directorios internos excluidos del tracking de archivos
+_EXCLUDED_DIRS = frozenset({'.claude', '.git', 'node_modules', '__pycache__', '.venv', '.next', 'dist', 'build'})
+
 # Process Manager para evitar leaks y manejar cleanup
 class ProcessManager:
     """Gestor centralizado de procesos con cleanup garantizado"""
@@ -209,7 +223,7 @@ def get_current_files(directory: str = ".", use_cache: bool = True) -> Set[str]:
         files = set()
         for root, dirs, filenames in os.walk(directory):
             # Excluir directorios internos
-            dirs[:] = [d for d in dirs if d not in {'.claude', '.git', 'node_modules', '__pycache__', '.venv', '.next', 'dist', 'build'}]
+            dirs[:] = [d for d in dirs if d not in _EXCLUDED_DIRS]
 
             for filename in filenames:
                 files.add(os.path.join(root, filename))
@@ -326,36 +340,41 @@ async def list_tools() -> List[types.Tool]:
 @server.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
     """Manejar llamadas a herramientas"""
-    start_time = time.perf_counter()
+    # Herramienta desconocida: responder sin crear contexto ni registrar la petición
+    if name != "ccglm":
+        return [types.TextContent(type="text", text=f"❌ Error: Unknown tool: {name}")]
+
+    # Inicio en ns enteros: log_response/log_error restan sin aritmética float
+    start_time = time.perf_counter_ns()
+
+    # Codificar el prompt una sola vez: el hash del contexto y el stdin del proceso usan los mismos bytes
+    prompt_bytes, prompt_sha256 = encode_and_hash(arguments.get("prompt", ""))
+
+    # Create request context with enhanced logging (compartido con el except)
+    context = ccglm_logger.create_request_context(name, arguments, prompt_sha256)
+
+    # Log request event
+    ccglm_logger.log_request(context)
 
     try:
-        # Create request context with enhanced logging
-        context = ccglm_logger.create_request_context(name, arguments)
-
-        # Log request event
-        ccglm_logger.log_request(context)
-
-        if name == "ccglm":
-            prompt = arguments.get("prompt", "")
-
-            # VALIDACIÓN DE IDIOMA
-            if contains_chinese(prompt):
-                error_msg = (
-                    "❌ CCGLM-MCP: Idioma no soportado\n\n"
-                    "Los prompts en chino no son aceptados por este servidor.\n"
-                    "GLM-4.6 está optimizado para español e inglés.\n\n"
-                    "Idiomas permitidos: Español, Inglés\n"
-                    "Idiomas bloqueados: Chino (中文/繁體/简体)\n\n"
-                    "Sugerencia: Use el modelo Claude principal para procesamiento en chino."
-                )
-                logger.warning("Prompt rechazado por contener caracteres chinos")
-                validation_result = {"error": error_msg}
-                ccglm_logger.log_response(context, validation_result, start_time)
-                return [types.TextContent(type="text", text=error_msg)]
-
-            result = await ccglm_route(arguments)
-        else:
-            result = {"error": f"Unknown tool: {name}"}
+        prompt = arguments.get("prompt", "")
+
+        # VALIDACIÓN DE IDIOMA
+        if contains_chinese(prompt):
+            error_msg = (
+                "❌ CCGLM-MCP: Idioma no soportado\n\n"
+                "Los prompts en chino no son aceptados por este servidor.\n"
+                "GLM-4.6 está optimizado para español e inglés.\n\n"
+                "Idiomas permitidos: Español, Inglés\n"
+                "Idiomas bloqueados: Chino (中文/繁體/简体)\n\n"
+                "Sugerencia: Use el modelo Claude principal para procesamiento en chino."
+            )
+            logger.warning("Prompt rechazado por contener caracteres chinos")
+            validation_result = {"error": error_msg}
+            ccglm_logger.log_response(context, validation_result, start_time)
+            return [types.TextContent(type="text", text=error_msg)]
+
+        result = await ccglm_route(arguments, prompt_bytes)
 
         # Log response event
         ccglm_logger.log_response(context, result, start_time)
@@ -366,24 +385,25 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextCont
                 response = f"❌ Error: {result['error']}"
             else:
                 # Para GLM, mostrar solo la respuesta
-                response = result.get("response", json.dumps(result, indent=2, ensure_ascii=False))
+                response = result["response"] if "response" in result else dumps_result(result)
         else:
             response = str(result)
 
         return [types.TextContent(type="text", text=response)]
 
     except Exception as e:
-        # Log error event with enhanced logging
-        context = ccglm_logger.create_request_context(name, arguments)
+        # Log error event with enhanced logging (mismo request_id)
         ccglm_logger.log_error(context, e, start_time)
         return [types.TextContent(
             type="text",
             text=f"❌ Error executing {name}: {str(e)}"
         )]
 
-async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
+async def ccglm_route(args: Dict[str, Any], prompt_bytes: Optional[bytes] = None) -> Dict[str, Any]:
     """Route prompt to GLM via Claude CLI with Z.AI credentials"""
     prompt = args.get("prompt", "")
+    if prompt_bytes is None:
+        prompt_bytes = prompt.encode('utf-8')
     start_time = time.time()
 
     if not prompt:
@@ -460,7 +480,7 @@ async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
             logger.info(f"🔄 Sending prompt to GLM model {model} (timeout: {effective_timeout}s)")
 
             stdout, stderr = await asyncio.wait_for(
-                process.communicate(input=prompt.encode('utf-8')),
+                process.communicate(input=prompt_bytes),
                 timeout=effective_timeout
             )
 
@@ -515,7 +535,7 @@ async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
                 context, "file_creation",
                 files_created=len(new_files),
                 new_files=new_files[:10],
-                file_summary=" ".join([os.path.basename(f) for f in new_files[:5]])
+                file_summary=" ".join(os.path.basename(f) for f in new_files[:5])
             )
             logger.info(f"✅ Success: GLM created {len(new_files)} files")
             response_text = format_file_summary(new_files, stdout_text)
@@ -535,14 +555,15 @@ async def ccglm_route(args: Dict[str, Any]) -> Dict[str, Any]:
             logger.warning("⚠️  GLM completed but returned empty response and created no files")
             response_text = "⚠️  GLM execution completed but returned no output or created files. Check GLM logs for details."
 
+        now = time.time()
         final_response = {
             "response": response_text,
             "model_requested": model,
             "model_configured": env["ANTHROPIC_MODEL"],
             "model_used": model,  # Esto debería verificarse con la API en el futuro
             "success": True,
-            "timestamp": datetime.now().isoformat(),
-            "execution_time": round(time.time() - start_time, 2),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)) + f".{int(now % 1 * 1e6):06d}",
+            "execution_time": round(now - start_time, 2),
             "exit_code": process.returncode,
             "files_created": len(new_files),
             "new_files": new_files[:10] if new_files else [],  # Limitar a primeros 10
@@ -9,15 +9,72 @@ import logging
 import logging.handlers
 import os
 import re
+import stat
 import hashlib
+import atexit
 import time
 import uuid
 import threading
-from datetime import datetime, timezone
+from dataclasses import dataclass
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import Any, Dict, Optional
-from queue import Queue
+from typing import Any, Dict, Optional, Tuple, Union
+from queue import Full, Queue
+
+# Optional orjson: JSON encoding in native code for the JSONL sink
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(data: Dict[str, Any]) -> str:
+    """Serialize a log entry to a JSON line, using orjson when available"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits: fall back to the stdlib encoder
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _json_dumps_bytes(data: Dict[str, Any]) -> bytes:
+    """Serialize a log entry to a newline-terminated UTF-8 JSON line"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return (json.dumps(data, ensure_ascii=False, default=str) + '\n').encode('utf-8', 'replace')
+
+
+# (second, "YYYY-MM-DDTHH:MM:SS") of the last formatted timestamp
+_ts_cache = (0, "")
+
+
+def _utc_timestamp() -> str:
+    """ISO 8601 UTC timestamp with microseconds, formatting the date part once per second"""
+    global _ts_cache
+    ns = time.time_ns()
+    sec, frac = divmod(ns, 1_000_000_000)
+    cached_sec, prefix = _ts_cache
+    if sec != cached_sec:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        _ts_cache = (sec, prefix)
+    return f"{prefix}.{frac // 1000:06d}Z"
+
+
+# Integer codes for the structured events, used by compact JSONL output
+EVENT_CODES = {
+    'startup': 1,
+    'request': 2,
+    'response': 3,
+    'error': 4,
+    'process': 5,
+    'shutdown': 6,
+    'format_error': 7,
+}
 
 
 class SafeJSONFormatter(logging.Formatter):
@@ -25,67 +82,170 @@ class SafeJSONFormatter(logging.Formatter):
     JSON formatter that sanitizes sensitive data and truncates long fields
     """
 
-    def __init__(self, max_preview_len: int = 512, max_trace_len: int = 4000):
+    # Sensitive information patterns, combined so each string is scanned once.
+    # Quantifiers are bounded so long runs of quotes/spaces cannot make a
+    # match attempt scan the rest of a large message; the `long` branch only
+    # flags a keyword followed by a separator run past the bound
+    SENSITIVE_RE = re.compile(
+        r'(?P<glm>GLM_AUTH_TOKEN[\'"\s]{0,16}[:=][\'"\s]{0,16}[a-zA-Z0-9._-]{1,4096})'
+        r'|(?:token|api[_-]?key|secret|authorization|password|bearer)[\'"\s]{0,16}[:=][\'"\s]{0,16}[a-zA-Z0-9_-]{1,4096}'
+        r'|(?P<long>(?:GLM_AUTH_TOKEN|token|api[_-]?key|secret|authorization|password|bearer)[\'"\s]{17})',
+        re.IGNORECASE
+    )
+    # What a bounded match leaves out: the rest of the value, or the rest of a
+    # long separator run up to the value. Matched once per hit, so linear
+    GLM_VALUE_TAIL_RE = re.compile(r'[a-zA-Z0-9._-]*')
+    VALUE_TAIL_RE = re.compile(r'[a-zA-Z0-9_-]*')
+    LONG_SEPARATOR_RE = re.compile(r'[\'"\s]*[:=][\'"\s]*[a-zA-Z0-9._-]+')
+
+    # Structured fields copied from the record, in output order
+    RECORD_FIELDS = ('event', 'request_id', 'session_id', 'instance_id', 'tool', 'method',
+                     'prompt_preview', 'prompt_sha256', 'response_preview', 'latency_ms',
+                     'exit_code', 'files_created', 'files_modified', 'new_files',
+                     'modified_files', 'stderr_preview', 'model', 'transport',
+                     'pid', 'error_type', 'error_message', 'traceback', 'cmd_preview', 'cwd')
+
+    # Fields truncated to max_preview_len, and list fields capped at 10 items
+    PREVIEW_FIELDS = ('prompt_preview', 'response_preview', 'stderr_preview', 'message')
+    ARRAY_FIELDS = ('new_files', 'modified_files')
+
+    def __init__(self, max_preview_len: int = 512, max_trace_len: int = 4000,
+                 compact: bool = False):
         super().__init__()
         self.max_preview_len = max_preview_len
         self.max_trace_len = max_trace_len
-
-        # Patterns to redact sensitive information
-        self.sensitive_patterns = [
-            (re.compile(r'(token|api[_-]?key|secret|authorization|password|bearer)[\'"\s]*[:=][\'"\s]*([a-zA-Z0-9_-]+)', re.IGNORECASE), '***REDACTED***'),
-            (re.compile(r'GLM_AUTH_TOKEN[\'"\s]*[:=][\'"\s]*([a-zA-Z0-9._-]+)', re.IGNORECASE), 'GLM_AUTH_TOKEN=***REDACTED***'),
-        ]
+        # Compact mode writes "lv" (levelno) and "e" (EVENT_CODES) instead
+        # of the level and event names
+        self.compact = compact
+
+        # (field, limit) pairs resolved once, so each record is a single pass
+        self._text_limits = tuple(
+            (field, max_preview_len) for field in self.PREVIEW_FIELDS
+        ) + (('traceback', max_trace_len),)
+
+    def _sanitize_str(self, text: str) -> str:
+        """Redact sensitive values in a string"""
+        # Every pattern needs a ':' or '=' separator: two C-level scans skip
+        # the regex for most strings
+        if ':' not in text and '=' not in text:
+            return text
+        parts = []
+        pos = 0
+        search = self.SENSITIVE_RE.search
+        while True:
+            match = search(text, pos)
+            if match is None:
+                break
+            kind = match.lastgroup
+            if kind == 'long':
+                rest = self.LONG_SEPARATOR_RE.match(text, match.end())
+                if rest is None:
+                    # No value after the run: not a secret
+                    parts.append(text[pos:match.end()])
+                    pos = match.end()
+                    continue
+                end = rest.end()
+                is_glm = match.group('long')[:14].upper() == 'GLM_AUTH_TOKEN'
+            else:
+                # Redact the whole value, not just its first 4096 chars
+                is_glm = kind == 'glm'
+                tail = self.GLM_VALUE_TAIL_RE if is_glm else self.VALUE_TAIL_RE
+                end = tail.match(text, match.end()).end()
+            parts.append(text[pos:match.start()])
+            parts.append('GLM_AUTH_TOKEN=***REDACTED***' if is_glm else '***REDACTED***')
+            pos = end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return ''.join(parts)
+
+    def _is_sensitive_key(self, key: Any) -> bool:
+        """Check if a key name looks sensitive"""
+        return isinstance(key, str) and ('=' in key or ':' in key) and self.SENSITIVE_RE.search(key) is not None
 
     def format(self, record: logging.LogRecord) -> str:
         """Format log record as JSON line"""
         try:
-            # Create base log entry
+            return _json_dumps(self._build_entry(record))
+        except Exception as e:
+            return json.dumps(self._error_entry(record, e), ensure_ascii=False)
+
+    def format_bytes(self, record: logging.LogRecord) -> bytes:
+        """Format log record as a newline-terminated UTF-8 JSON line"""
+        try:
+            return _json_dumps_bytes(self._build_entry(record))
+        except Exception as e:
+            return (json.dumps(self._error_entry(record, e), ensure_ascii=False) + '\n').encode('utf-8', 'replace')
+
+    def _build_entry(self, record: logging.LogRecord) -> Dict[str, Any]:
+        """Build the sanitized and truncated log entry for a record"""
+        # Create base log entry
+        if self.compact:
+            log_entry = {"ts": _utc_timestamp(), "lv": record.levelno, "logger": record.name}
+        else:
             log_entry = {
-                "ts": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+                "ts": _utc_timestamp(),
                 "level": record.levelname,
                 "logger": record.name,
             }
 
-            # Add structured data if present in record.__dict__
-            if hasattr(record, 'event'):
-                log_entry['event'] = record.event
-
-            # Add standard fields if present
-            for field in ['request_id', 'session_id', 'instance_id', 'tool', 'method',
-                         'prompt_preview', 'prompt_sha256', 'response_preview', 'latency_ms',
-                         'exit_code', 'files_created', 'files_modified', 'new_files',
-                         'modified_files', 'stderr_preview', 'model', 'transport',
-                         'pid', 'error_type', 'error_message', 'traceback', 'cmd_preview', 'cwd']:
-                if hasattr(record, field):
-                    log_entry[field] = getattr(record, field)
-
-            # Handle message field
-            if hasattr(record, 'msg') and record.msg:
-                if isinstance(record.msg, dict):
-                    # If msg is already a dict, merge it
-                    log_entry.update(record.msg)
-                else:
-                    # If msg is a string, add as message field
-                    log_entry['message'] = str(record.msg)
-
-            # Sanitize sensitive data
-            log_entry = self._sanitize_dict(log_entry)
-
-            # Truncate long fields
-            log_entry = self._truncate_fields(log_entry)
-
-            return json.dumps(log_entry, ensure_ascii=False, default=str)
+        # Add structured fields present in record.__dict__ (set via `extra`)
+        attrs = record.__dict__
+        for field in self.RECORD_FIELDS:
+            if field in attrs:
+                log_entry[field] = attrs[field]
+
+        # Handle message field
+        if hasattr(record, 'msg') and record.msg:
+            if isinstance(record.msg, dict):
+                # If msg is already a dict, merge it
+                log_entry.update(record.msg)
+            else:
+                # If msg is a string, add as message field, merging any
+                # %-style args here in the listener thread
+                log_entry['message'] = record.getMessage()
+
+        # Exceptions logged with exc_info=True (or logger.exception)
+        if record.exc_info and 'traceback' not in log_entry:
+            log_entry['traceback'] = self.formatException(record.exc_info)
+
+        if self.compact:
+            # Unknown events keep their name
+            event = log_entry.get('event')
+            if isinstance(event, str) and event in EVENT_CODES:
+                del log_entry['event']
+                log_entry['e'] = EVENT_CODES[event]
+
+        # Sanitize sensitive data (log_entry is built here, so in place)
+        self._sanitize_entry(log_entry)
+
+        # Truncate long fields
+        self._truncate_fields(log_entry)
+
+        return log_entry
+
+    @staticmethod
+    def _error_entry(record: logging.LogRecord, e: Exception) -> Dict[str, Any]:
+        """Fallback entry used when a record cannot be formatted"""
+        return {
+            "ts": _utc_timestamp(),
+            "level": "ERROR",
+            "logger": "ccglm-mcp",
+            "event": "format_error",
+            "error": f"Failed to format log: {str(e)}",
+            "original_message": str(record.msg) if hasattr(record, 'msg') else ""
+        }
 
-        except Exception as e:
-            # Fallback to simple format if JSON formatting fails
-            return json.dumps({
-                "ts": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
-                "level": "ERROR",
-                "logger": "ccglm-mcp",
-                "event": "format_error",
-                "error": f"Failed to format log: {str(e)}",
-                "original_message": str(record.msg) if hasattr(record, 'msg') else ""
-            }, ensure_ascii=False)
+    def _sanitize_entry(self, entry: Dict[str, Any]) -> None:
+        """Sanitize a log entry in place, copying only nested containers"""
+        for key, value in entry.items():
+            if self._is_sensitive_key(key):
+                entry[key] = "***REDACTED***"
+            elif isinstance(value, str):
+                entry[key] = self._sanitize_str(value)
+            elif isinstance(value, (dict, list, tuple)):
+                # Nested containers may belong to the caller: sanitize a copy
+                entry[key] = self._sanitize_dict(value)
 
     def _sanitize_dict(self, data: Any) -> Any:
         """Recursively sanitize dictionary values"""
@@ -93,7 +253,7 @@ class SafeJSONFormatter(logging.Formatter):
             sanitized = {}
             for key, value in data.items():
                 # Check if key name looks sensitive
-                if any(pattern[0].search(key) for pattern in self.sensitive_patterns):
+                if self._is_sensitive_key(key):
                     sanitized[key] = "***REDACTED***"
                 else:
                     sanitized[key] = self._sanitize_dict(value)
@@ -102,51 +262,257 @@ class SafeJSONFormatter(logging.Formatter):
             return [self._sanitize_dict(item) for item in data]
         elif isinstance(data, str):
             # Check for sensitive patterns in string values
-            for pattern, replacement in self.sensitive_patterns:
-                data = pattern.sub(replacement, data)
-            return data
+            return self._sanitize_str(data)
         else:
             return data
 
     def _truncate_fields(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Truncate long text fields"""
-        truncated = data.copy()
+        """Truncate long text fields in place"""
+        # Text fields (previews, message, traceback) with their limits
+        for field, limit in self._text_limits:
+            value = data.get(field)
+            if isinstance(value, str) and len(value) > limit:
+                data[field] = value[:limit] + "...[TRUNCATED]"
 
-        # Text fields to truncate
-        text_fields = ['prompt_preview', 'response_preview', 'stderr_preview', 'message']
-        for field in text_fields:
-            if field in truncated and isinstance(truncated[field], str):
-                if len(truncated[field]) > self.max_preview_len:
-                    truncated[field] = truncated[field][:self.max_preview_len] + "...[TRUNCATED]"
+        # Limit array sizes
+        for field in self.ARRAY_FIELDS:
+            value = data.get(field)
+            if isinstance(value, (list, tuple)) and len(value) > 10:
+                data[field] = list(value[:10]) + [f"...and {len(value) - 10} more"]
 
-        # Traceback field
-        if 'traceback' in truncated and isinstance(truncated['traceback'], str):
-            if len(truncated['traceback']) > self.max_trace_len:
-                truncated['traceback'] = truncated['traceback'][:self.max_trace_len] + "...[TRUNCATED]"
+        return data
 
-        # Limit array sizes
-        array_fields = ['new_files', 'modified_files']
-        for field in array_fields:
-            if field in truncated and isinstance(truncated[field], (list, tuple)):
-                if len(truncated[field]) > 10:
-                    truncated[field] = list(truncated[field][:10]) + [f"...and {len(truncated[field]) - 10} more"]
 
-        return truncated
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that enqueues records unformatted and never blocks
+
+    The stock prepare() formats every record on the calling thread (turning
+    dict messages into their repr). The listener runs in the same process,
+    so records are passed as-is and all formatting, sanitization and JSON
+    encoding happen in the listener thread.
+
+    When the bounded queue is full the oldest record is dropped (and
+    counted in `dropped`) instead of reporting an error for the new one.
+    Drain markers are never dropped, so a pending drain() still completes.
+    """
+
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            if self._drop_oldest():
+                self.dropped += 1
+            try:
+                self.queue.put_nowait(record)
+            except Full:
+                self.dropped += 1  # Another thread refilled the slot
+
+    def _drop_oldest(self) -> bool:
+        """Remove the oldest queued record, skipping drain markers"""
+        with self.queue.mutex:
+            items = self.queue.queue
+            for index, item in enumerate(items):
+                if not isinstance(item, _DrainMarker):
+                    del items[index]
+                    return True
+        return False
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that buffers writes and tracks the file size itself
+
+    The stock handler formats each record twice (once in shouldRollover to
+    measure it) and seeks/tells the stream, which flushes it, on every
+    record. Here each record is formatted once, the size is counted in
+    Python and the stream is only flushed every `flush_interval` seconds,
+    when the listener finds the queue empty, or on close.
+
+    The file is opened in binary mode: formatters that provide
+    `format_bytes` (SafeJSONFormatter) hand over encoded lines directly,
+    anything else is encoded here.
+
+    Only regular files are sized and rotated, so a FIFO or /dev/stderr can
+    be the log path. Other processes may append to the same file, so the
+    counted size is refreshed from the file on every flush and re-read
+    before deciding to roll over.
+    """
+
+    def __init__(self, filename, maxBytes: int = 0, backupCount: int = 0,
+                 encoding: Optional[str] = None, delay: bool = False,
+                 buffer_size: int = 128 * 1024, flush_interval: float = 0.2):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._size = 0
+        self._regular = False
+        self._last_flush = time.monotonic()
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount,
+                         encoding=encoding, delay=delay)
+
+    def _open(self):
+        mode = self.mode if 'b' in self.mode else self.mode + 'b'
+        stream = open(self.baseFilename, mode, buffering=self.buffer_size)
+        st = os.fstat(stream.fileno())
+        self._regular = stat.S_ISREG(st.st_mode)
+        self._size = st.st_size if self._regular else 0
+        return stream
+
+    def _needs_rollover(self, size: int) -> bool:
+        """Confirm a rollover against the real file size before doing it"""
+        # See bpo-45401: never roll over anything other than regular files
+        if os.path.exists(self.baseFilename) and not os.path.isfile(self.baseFilename):
+            return False
+        self.flush()
+        return self._size > 0 and self._size + size >= self.maxBytes
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            format_bytes = getattr(self.formatter, 'format_bytes', None)
+            if format_bytes is not None:
+                data = format_bytes(record)
+            else:
+                data = (self.format(record) + self.terminator).encode(self.encoding or 'utf-8', 'replace')
+            size = len(data)
+            if self.stream is None:
+                self.stream = self._open()
+            if (self._regular and self.maxBytes > 0 and self._size + size >= self.maxBytes
+                    and self._needs_rollover(size)):
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(data)
+            self._size += size
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        super().flush()
+        stream = self.stream
+        if self._regular and stream is not None and not stream.closed:
+            # Includes what other processes appended to a shared log file
+            self._size = os.fstat(stream.fileno()).st_size
+
+
+class _DrainMarker:
+    """Queue item that signals when the listener has reached it"""
+
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """QueueListener that flushes its handlers whenever the queue runs empty
+
+    Bursts are written in large buffered chunks, while a lone record is
+    still on disk as soon as it has been handled.
+    """
+
+    def handle(self, record: logging.LogRecord) -> None:
+        if isinstance(record, _DrainMarker):
+            self.flush()
+            record.done.set()
+            return
+        super().handle(record)
+        if self.queue.empty():
+            self.flush()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every record queued so far is written and flushed
+
+        Returns False if the listener did not get there within `timeout`.
+        """
+        if self._thread is None:
+            self.flush()
+            return True
+        marker = _DrainMarker()
+        try:
+            self.queue.put(marker, timeout=timeout)
+        except Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def flush(self) -> None:
+        """Flush every handler of the listener"""
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self) -> None:
+        super().stop()
+        self.flush()
+
+
+def hash_bytes(data: bytes) -> str:
+    """Calculate SHA256 hash of already encoded text for correlation"""
+    return hashlib.sha256(data).hexdigest()[:16]
 
 
 def hash_text(text: str) -> str:
     """Calculate SHA256 hash of text for correlation without exposing content"""
-    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    return hash_bytes(text.encode('utf-8'))
+
+
+def encode_and_hash(text: str) -> Tuple[bytes, str]:
+    """Encode text as UTF-8 once and hash it, so callers can reuse the bytes"""
+    data = text.encode('utf-8')
+    return data, hash_bytes(data)
+
+
+@dataclass(frozen=True)
+class LogConfig:
+    """Logging settings read from the environment in a single pass"""
+    log_path: Optional[str]
+    log_dir: Optional[str]
+    per_process: bool
+    log_level: str
+    session_id: Optional[str]
+    compact: bool = False
+
+    @classmethod
+    def from_env(cls, environ: Optional[Dict[str, str]] = None) -> "LogConfig":
+        """Build the config from a snapshot of the environment"""
+        env = dict(os.environ if environ is None else environ)
+        return cls(
+            log_path=env.get('CCGLM_MCP_LOG_PATH') or None,
+            # Priority: CCGLM_MCP_LOG_DIR > CLAUDE_LOG_DIR > ~/.claude/logs
+            log_dir=env.get('CCGLM_MCP_LOG_DIR') or env.get('CLAUDE_LOG_DIR') or None,
+            per_process=env.get('CCGLM_MCP_PER_PROCESS_LOGS', 'true').lower() == 'true',
+            log_level=env.get('CCGLM_MCP_LOG_LEVEL', 'INFO').upper(),
+            session_id=env.get('CLAUDE_SESSION'),
+            compact=env.get('CCGLM_MCP_COMPACT_LOGS', 'false').lower() == 'true',
+        )
 
 
 class CCGLMLogger:
     """Enhanced logger with dual sinks (stderr + JSONL file)"""
 
-    def __init__(self, name: str = "ccglm-mcp"):
+    __slots__ = ('name', 'config', 'max_preview_len', 'instance_id', 'pid', 'session_id',
+                 'log_dir', 'log_file', 'logger', 'log_queue', 'queue_handler', 'queue_listener')
+
+    def __init__(self, name: str = "ccglm-mcp", config: Optional[LogConfig] = None,
+                 max_preview_len: int = 512):
         self.name = name
+        self.config = config or LogConfig.from_env()
+        self.max_preview_len = max_preview_len
         self.instance_id = str(uuid.uuid4())
         self.pid = os.getpid()
-        self.session_id = os.getenv('CLAUDE_SESSION')
+        self.session_id = self.config.session_id
 
         # Determine log directory and file path
         self.log_dir = self._get_log_directory()
@@ -165,33 +531,44 @@ class CCGLMLogger:
     def _get_log_directory(self) -> Path:
         """Determine log directory based on environment variables"""
         # Priority: CCGLM_MCP_LOG_PATH > CCGLM_MCP_LOG_DIR > CLAUDE_LOG_DIR > ~/.claude/logs
-        if os.getenv('CCGLM_MCP_LOG_PATH'):
-            return Path(os.getenv('CCGLM_MCP_LOG_PATH')).parent
+        if self.config.log_path:
+            return Path(self.config.log_path).parent
 
-        log_dir = (
-            os.getenv('CCGLM_MCP_LOG_DIR') or
-            os.getenv('CLAUDE_LOG_DIR') or
-            Path.home() / '.claude' / 'logs'
-        )
+        if self.config.log_dir:
+            return Path(self.config.log_dir)
 
-        return Path(log_dir)
+        return Path.home() / '.claude' / 'logs'
 
     def _get_log_file_path(self) -> Path:
         """Determine log file path"""
         # Check if full path is specified
-        if os.getenv('CCGLM_MCP_LOG_PATH'):
-            return Path(os.getenv('CCGLM_MCP_LOG_PATH'))
+        if self.config.log_path:
+            return Path(self.config.log_path)
 
         # Determine per-process logging
-        per_process = os.getenv('CCGLM_MCP_PER_PROCESS_LOGS', 'true').lower() == 'true'
-
-        if per_process:
+        if self.config.per_process:
             filename = f"ccglm-mcp-{self.pid}.jsonl"
         else:
             filename = "ccglm-mcp.jsonl"
 
         return self.log_dir / filename
 
+    def _write_legend(self) -> None:
+        """Write the code legend for compact logs next to the log file"""
+        legend = {
+            "lv": {str(level): logging.getLevelName(level)
+                   for level in (logging.DEBUG, logging.INFO, logging.WARNING,
+                                 logging.ERROR, logging.CRITICAL)},
+            "e": {str(code): event for event, code in EVENT_CODES.items()},
+        }
+        try:
+            legend_file = self.log_dir / 'ccglm-mcp-legend.json'
+            tmp_file = legend_file.with_name(f"{legend_file.name}.{self.pid}.tmp")
+            tmp_file.write_text(json.dumps(legend, indent=2), encoding='utf-8')
+            os.replace(tmp_file, legend_file)
+        except OSError:
+            pass  # The legend is a convenience: never block logging on it
+
     def _setup_logging(self) -> logging.Logger:
         """Setup dual logging infrastructure"""
         logger = logging.getLogger(self.name)
@@ -201,8 +578,7 @@ class CCGLMLogger:
         logger.handlers.clear()
 
         # Determine log level from environment
-        log_level = os.getenv('CCGLM_MCP_LOG_LEVEL', 'INFO').upper()
-        logger.setLevel(getattr(logging, log_level, logging.INFO))
+        logger.setLevel(getattr(logging, self.config.log_level, logging.INFO))
 
         # Create log directory if it doesn't exist
         try:
@@ -216,11 +592,11 @@ class CCGLMLogger:
 
         # Setup queue for non-blocking logging
         self.log_queue = Queue(maxsize=10000)
-        queue_handler = logging.handlers.QueueHandler(self.log_queue)
+        self.queue_handler = queue_handler = DeferredQueueHandler(self.log_queue)
 
         # Setup file handler with JSON formatter
         try:
-            file_handler = RotatingFileHandler(
+            file_handler = BufferedRotatingFileHandler(
                 self.log_file,
                 maxBytes=10 * 1024 * 1024,  # 10MB
                 backupCount=5,
@@ -228,7 +604,9 @@ class CCGLMLogger:
                 encoding='utf-8'
             )
             file_handler.setLevel(logging.INFO)
-            file_handler.setFormatter(SafeJSONFormatter())
+            file_handler.setFormatter(SafeJSONFormatter(compact=self.config.compact))
+            if self.config.compact:
+                self._write_legend()
 
             # Setup stderr handler with human-readable format
             stderr_handler = logging.StreamHandler()
@@ -239,13 +617,15 @@ class CCGLMLogger:
             stderr_handler.setFormatter(stderr_formatter)
 
             # Setup queue listener
-            self.queue_listener = logging.handlers.QueueListener(
+            self.queue_listener = FlushingQueueListener(
                 self.log_queue,
                 file_handler,
                 stderr_handler,
                 respect_handler_level=True
             )
             self.queue_listener.start()
+            # Drain pending records on interpreter exit even without shutdown()
+            atexit.register(self._stop_listener)
 
             # Add queue handler to logger
             logger.addHandler(queue_handler)
@@ -262,10 +642,13 @@ class CCGLMLogger:
 
         return logger
 
-    def create_request_context(self, tool: str, args: Dict[str, Any]) -> Dict[str, Any]:
-        """Create request context with sanitized data"""
+    def create_request_context(self, tool: str, args: Dict[str, Any],
+                               prompt_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Create request context with sanitized data (prompt_sha256 if already computed)"""
         request_id = str(uuid.uuid4())
         prompt = args.get('prompt', '')
+        if prompt and prompt_sha256 is None:
+            prompt_sha256 = hash_text(prompt)
 
         return {
             "request_id": request_id,
@@ -274,8 +657,8 @@ class CCGLMLogger:
             "tool": tool,
             "method": "call_tool",
             "pid": self.pid,
-            "prompt_preview": prompt[:self.max_preview_len] if hasattr(self, 'max_preview_len') else prompt[:512],
-            "prompt_sha256": hash_text(prompt) if prompt else None,
+            "prompt_preview": prompt[:self.max_preview_len],
+            "prompt_sha256": prompt_sha256 if prompt else None,
             "args": self._sanitize_args(args)
         }
 
@@ -296,15 +679,25 @@ class CCGLMLogger:
         }
         self.logger.info(log_data)
 
+    @staticmethod
+    def _latency_ms(start_time: Union[int, float]) -> float:
+        """
+        Milliseconds elapsed since start_time, rounded to 2 decimals
+
+        Accepts time.perf_counter_ns() (int, no float math until the final
+        division) or time.perf_counter() (float) starts.
+        """
+        if isinstance(start_time, int):
+            return ((time.perf_counter_ns() - start_time) // 10_000) / 100
+        return round((time.perf_counter() - start_time) * 1000, 2)
+
     def log_response(self, context: Dict[str, Any], result: Dict[str, Any],
-                     start_time: float) -> None:
+                     start_time: Union[int, float]) -> None:
         """Log response event"""
-        latency_ms = (time.perf_counter() - start_time) * 1000
-
         log_data = {
             "event": "response",
             **context,
-            "latency_ms": round(latency_ms, 2),
+            "latency_ms": self._latency_ms(start_time),
             "model": result.get('model', 'glm-4.6'),
             "response_preview": str(result.get('response', ''))[:512],
             "files_created": result.get('files_created', 0),
@@ -320,14 +713,12 @@ class CCGLMLogger:
         self.logger.info(log_data)
 
     def log_error(self, context: Dict[str, Any], error: Exception,
-                  start_time: float) -> None:
+                  start_time: Union[int, float]) -> None:
         """Log error event"""
-        latency_ms = (time.perf_counter() - start_time) * 1000
-
         log_data = {
             "event": "error",
             **context,
-            "latency_ms": round(latency_ms, 2),
+            "latency_ms": self._latency_ms(start_time),
             "error_type": type(error).__name__,
             "error_message": str(error)
         }
@@ -356,18 +747,37 @@ class CCGLMLogger:
 
         self.logger.info(log_data)
 
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Block until every record logged so far has reached the log file"""
+        listener = getattr(self, 'queue_listener', None)
+        if listener is not None:
+            return listener.drain(timeout)
+        for handler in self.logger.handlers:
+            handler.flush()
+        return True
+
+    def _stop_listener(self) -> None:
+        """Stop the queue listener once, writing out every queued record"""
+        listener = getattr(self, 'queue_listener', None)
+        if listener is not None:
+            self.queue_listener = None
+            listener.stop()
+
     def shutdown(self) -> None:
         """Graceful shutdown"""
         try:
-            self.logger.info({
+            shutdown_event = {
                 "event": "shutdown",
                 "instance_id": self.instance_id,
                 "pid": self.pid
-            })
+            }
+            dropped = getattr(self, 'queue_handler', None) and self.queue_handler.dropped
+            if dropped:
+                shutdown_event["dropped_records"] = dropped
+            self.logger.info(shutdown_event)
 
             # Stop queue listener if it exists
-            if hasattr(self, 'queue_listener'):
-                self.queue_listener.stop()
+            self._stop_listener()
 
         except Exception:
             pass  # Ignore errors during shutdown
@@ -381,4 +791,13 @@ def get_logger() -> CCGLMLogger:
     global _ccglm_logger
     if _ccglm_logger is None:
         _ccglm_logger = CCGLMLogger()
-    return _ccglm_logger
\ No newline at end of file
+    return _ccglm_logger
+
+
+def __getattr__(name: str) -> Any:
+    """Lazily bind LOGGER to the global instance on first access"""
+    if name == "LOGGER":
+        # Cached as a module global: later lookups skip this hook entirely
+        globals()["LOGGER"] = logger = get_logger()
+        return logger
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
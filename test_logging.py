@@ -11,11 +11,65 @@ import os
 import tempfile
 import time
 import uuid
+from queue import Queue
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, Any
 
+try:
+    import pytest
+except ImportError:  # Run as a script: main() builds the shared loggers
+    pytest = None
+
 # Import the logging utilities
-from logging_utils import CCGLMLogger, SafeJSONFormatter, get_logger
+from logging_utils import (CCGLMLogger, DeferredQueueHandler, EVENT_CODES, SafeJSONFormatter,
+                           _DrainMarker, get_logger)
+
+@contextmanager
+def env_patch(**values: str):
+    """Set environment variables for the duration of a block, then restore them"""
+    old = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in old.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+@contextmanager
+def shared_loggers():
+    """One log directory and one logger per file layout, shut down on exit
+
+    Each test using them reads only the entries it wrote.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Loggers read the environment once, at construction
+        with env_patch(CCGLM_MCP_LOG_DIR=temp_dir, CCGLM_MCP_PER_PROCESS_LOGS='true'):
+            process_logger = CCGLMLogger("test-ccglm")
+        with env_patch(CCGLM_MCP_LOG_DIR=temp_dir, CCGLM_MCP_PER_PROCESS_LOGS='false'):
+            single_logger = CCGLMLogger("test-single")
+        try:
+            yield process_logger, single_logger
+        finally:
+            process_logger.shutdown()
+            single_logger.shutdown()
+
+if pytest is not None:
+    @pytest.fixture(scope="module")
+    def loggers():
+        with shared_loggers() as pair:
+            yield pair
+
+    @pytest.fixture(scope="module")
+    def process_logger(loggers):
+        return loggers[0]
+
+    @pytest.fixture(scope="module")
+    def single_logger(loggers):
+        return loggers[1]
 
 def test_json_formatter():
     """Test SafeJSONFormatter with various data types"""
@@ -54,50 +108,73 @@ def test_json_formatter():
 
     print("✅ SafeJSONFormatter test passed")
 
-def test_ccglm_logger():
-    """Test CCGLMLogger initialization and basic functionality"""
-    print("🧪 Testing CCGLMLogger...")
+def test_compact_formatter():
+    """Test compact output with numeric level and event codes"""
+    print("🧪 Testing compact SafeJSONFormatter...")
 
-    # Create logger in temporary directory
-    with tempfile.TemporaryDirectory() as temp_dir:
-        os.environ['CCGLM_MCP_LOG_DIR'] = temp_dir
-        os.environ['CCGLM_MCP_PER_PROCESS_LOGS'] = 'true'
+    formatter = SafeJSONFormatter(compact=True)
 
-        logger = CCGLMLogger("test-ccglm")
+    record = logging.LogRecord("test", logging.WARNING, "test.py", 1,
+                               {"event": "request", "tool": "ccglm"}, (), None)
+    parsed = json.loads(formatter.format(record))
+    assert parsed['lv'] == logging.WARNING and 'level' not in parsed
+    assert parsed['e'] == EVENT_CODES['request'] and 'event' not in parsed
+    assert parsed['tool'] == "ccglm"
 
-        # Test basic logging
-        logger.logger.info("Test message")
+    # Events without a code keep their name
+    record.msg = {"event": "custom_event"}
+    parsed = json.loads(formatter.format(record))
+    assert parsed['event'] == "custom_event" and 'e' not in parsed
 
-        # Give queue time to process
-        time.sleep(0.1)
+    print("✅ Compact SafeJSONFormatter test passed")
 
-        # Test request/response tracking
-        context = logger.create_request_context("test_tool", {"prompt": "test prompt"})
-        logger.log_request(context)
+def read_log_entries(logger: CCGLMLogger, **match: Any) -> list:
+    """Flush the logger and return the JSONL entries whose fields match"""
+    assert logger.flush(), "Log queue did not drain"
+    with open(logger.log_file, 'r') as f:
+        entries = [json.loads(line) for line in f]  # Should not raise exception
+    return [e for e in entries if all(e.get(k) == v for k, v in match.items())]
 
-        result = {"response": "test response", "files_created": 2}
-        logger.log_response(context, result, time.perf_counter())
+def test_ccglm_logger(process_logger: CCGLMLogger):
+    """Test CCGLMLogger initialization and basic functionality"""
+    print("🧪 Testing CCGLMLogger...")
+
+    # Test basic logging
+    process_logger.logger.info("Test message")
+
+    # Wait for the queue to be written out
+    process_logger.flush()
 
-        # Test process event logging
-        logger.log_process_event(context, "spawn", cmd_preview="test command")
+    # Test request/response tracking
+    context = process_logger.create_request_context("test_tool", {"prompt": "test prompt"})
+    process_logger.log_request(context)
 
-        # Give queue time to process all events
-        time.sleep(0.2)
+    result = {"response": "test response", "files_created": 2}
+    process_logger.log_response(context, result, time.perf_counter_ns())
 
-        # Check log file was created
-        log_file = logger.log_file
-        assert log_file.exists(), f"Log file not created: {log_file}"
+    # Test process event logging
+    process_logger.log_process_event(context, "spawn", cmd_preview="test command")
 
-        # Read and validate log content
-        with open(log_file, 'r') as f:
-            lines = f.readlines()
-            assert len(lines) >= 4  # startup + request + response + process
+    # Check log file was created
+    log_file = process_logger.log_file
+    assert log_file.exists(), f"Log file not created: {log_file}"
 
-            # Validate JSON structure
-            for line in lines:
-                json.loads(line)  # Should not raise exception
+    # The log file is shared between tests: keep this request's entries
+    lines = read_log_entries(process_logger, request_id=context['request_id'])
+    assert len(lines) >= 3  # request + response + process
+    responses = [e for e in lines if e.get('event') == 'response']
+    assert responses and responses[0]['latency_ms'] >= 0
 
-        print(f"✅ CCGLMLogger test passed - created {len(lines)} log entries")
+    # Tracebacks from exc_info survive the queue into the JSONL entry
+    try:
+        raise ValueError("boom for traceback test")
+    except ValueError:
+        process_logger.logger.error("Failure with traceback", exc_info=True)
+    failures = read_log_entries(process_logger, message="Failure with traceback")
+    assert failures, "exc_info entry not written"
+    assert "ValueError: boom for traceback test" in failures[-1].get('traceback', '')
+
+    print(f"✅ CCGLMLogger test passed - created {len(lines)} log entries")
 
 def test_sanitization():
     """Test data sanitization"""
@@ -154,78 +231,116 @@ def test_sanitization():
 
     print("✅ Sanitization test passed")
 
-def test_multi_process_logging():
+def test_sanitization_long_inputs():
+    """Test the bounded sensitive-data pattern on long inputs with separators"""
+    print("🧪 Testing sanitization on long inputs...")
+
+    formatter = SafeJSONFormatter(max_preview_len=200000, max_trace_len=100)
+
+    # Every input contains ':' or '=', so SENSITIVE_RE actually runs
+    cases = [
+        # Separator run longer than the {0,16} bound is still redacted
+        ("token" + " " * 150000 + "=x", "***REDACTED***"),
+        ("GLM_AUTH_TOKEN" + " " * 40 + ": abc.def rest", "GLM_AUTH_TOKEN=***REDACTED*** rest"),
+        # Long separator run with no value after it
+        ("token" + " " * 150000 + "ok=1", "token" + " " * 150000 + "ok=1"),
+        # Only separators, no keyword
+        (":" * 150000, ":" * 150000),
+        # Value longer than the {1,4096} bound is redacted whole
+        ("api_key: " + "a" * 150000 + " ok", "***REDACTED*** ok"),
+        # Short separator run within the bound
+        ("password=" + " " * 10 + "hunter2 ok", "***REDACTED*** ok"),
+    ]
+    for message, expected in cases:
+        record = logging.LogRecord(
+            name="test",
+            level=logging.INFO,
+            pathname="test.py",
+            lineno=1,
+            msg=message,
+            args=(),
+            exc_info=None
+        )
+        parsed = json.loads(formatter.format(record))
+        assert parsed['message'] == expected, f"Unexpected sanitization of {message[:20]!r}..."
+        assert "aaaa" not in parsed['message'], "Part of a long secret leaked"
+
+    print("✅ Sanitization long input test passed")
+
+def test_multi_process_logging(process_logger: CCGLMLogger, single_logger: CCGLMLogger):
     """Test multi-process logging support (simulated)"""
     print("🧪 Testing multi-process logging simulation...")
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        os.environ['CCGLM_MCP_LOG_DIR'] = temp_dir
-        os.environ['CCGLM_MCP_PER_PROCESS_LOGS'] = 'true'
-
-        # Test that per-process logging creates files with PID in name
-        logger = CCGLMLogger("test-process")
-
-        # Log file should contain PID
-        log_file = logger.log_file
-        expected_pid = str(os.getpid())
-        assert expected_pid in log_file.name, f"PID {expected_pid} not in log filename: {log_file}"
-
-        # Log something
-        logger.logger.info("Test message for multi-process")
-
-        # Give queue time to process
-        time.sleep(0.1)
-
-        # Verify file exists and contains our message
-        assert log_file.exists(), f"Log file not created: {log_file}"
-        with open(log_file, 'r') as f:
-            content = f.read()
-            assert "Test message for multi-process" in content
-
-        # Test with per-process disabled
-        os.environ['CCGLM_MCP_PER_PROCESS_LOGS'] = 'false'
-        logger2 = CCGLMLogger("test-single")
-        logger2.logger.info("Single process test")
-        time.sleep(0.1)
-        log_file2 = logger2.log_file
-        assert expected_pid not in log_file2.name, f"PID should not be in single log filename: {log_file2}"
-        assert log_file2.exists(), f"Single process log file not created: {log_file2}"
-
-        print("✅ Multi-process logging simulation test passed")
-
-def test_queue_performance():
+    # Per-process logging creates files with PID in name
+    log_file = process_logger.log_file
+    expected_pid = str(os.getpid())
+    assert expected_pid in log_file.name, f"PID {expected_pid} not in log filename: {log_file}"
+
+    # Log something
+    process_logger.logger.info("Test message for multi-process")
+
+    # Wait for the queue to be written out
+    process_logger.flush()
+
+    # Verify file exists and contains our message
+    assert log_file.exists(), f"Log file not created: {log_file}"
+    with open(log_file, 'r') as f:
+        content = f.read()
+        assert "Test message for multi-process" in content
+
+    # Test with per-process disabled
+    single_logger.logger.info("Single process test")
+    single_logger.flush()
+    log_file2 = single_logger.log_file
+    assert expected_pid not in log_file2.name, f"PID should not be in single log filename: {log_file2}"
+    assert log_file2.exists(), f"Single process log file not created: {log_file2}"
+
+    print("✅ Multi-process logging simulation test passed")
+
+def test_drop_oldest_keeps_drain_markers():
+    """Test that a full queue drops old records but never a pending drain marker"""
+    print("🧪 Testing drop-oldest with a drain marker...")
+
+    queue = Queue(maxsize=3)
+    handler = DeferredQueueHandler(queue)
+    records = [logging.LogRecord("test", logging.INFO, "test.py", 1, f"record {i}", (), None)
+               for i in range(5)]
+    marker = _DrainMarker()
+    queue.put_nowait(marker)
+    for record in records:
+        handler.handle(record)
+
+    items = list(queue.queue)
+    assert items[0] is marker, "Drain marker was dropped"
+    assert items[1:] == records[-2:], "Oldest records should be dropped first"
+    assert handler.dropped == 3
+
+    print("✅ Drop-oldest test passed")
+
+def test_queue_performance(single_logger: CCGLMLogger):
     """Test logging performance with queue handler"""
     print("🧪 Testing queue performance...")
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        os.environ['CCGLM_MCP_LOG_DIR'] = temp_dir
-        os.environ['CCGLM_MCP_PER_PROCESS_LOGS'] = 'false'
-
-        logger = CCGLMLogger("performance-test")
+    # Log many messages quickly
+    start_time = time.time()
+    message_count = 1000
 
-        # Log many messages quickly
-        start_time = time.time()
-        message_count = 1000
+    for i in range(message_count):
+        single_logger.logger.info("Performance test message %d", i)
 
-        for i in range(message_count):
-            logger.logger.info(f"Performance test message {i}")
+    # Returns once every queued record is written
+    assert single_logger.flush(), "Log queue did not drain"
 
-        # Give queue time to process
-        time.sleep(0.5)
+    end_time = time.time()
+    duration = end_time - start_time
+    messages_per_second = message_count / duration
 
-        end_time = time.time()
-        duration = end_time - start_time
-        messages_per_second = message_count / duration
+    # Check log file (shared with other tests)
+    lines = [e for e in read_log_entries(single_logger)
+             if e.get('message', '').startswith("Performance test message")]
+    assert len(lines) == message_count
 
-        # Check log file
-        log_file = logger.log_file
-        with open(log_file, 'r') as f:
-            lines = f.readlines()
-
-        # Should have startup + message_count
-        assert len(lines) >= message_count
-
-        print(f"✅ Queue performance test passed: {messages_per_second:.0f} messages/second")
+    print(f"✅ Queue performance test passed: {messages_per_second:.0f} messages/second")
 
 def main():
     """Run all tests"""
@@ -233,10 +348,15 @@ def main():
 
     try:
         test_json_formatter()
+        test_compact_formatter()
         test_sanitization()
-        test_ccglm_logger()
-        test_multi_process_logging()
-        test_queue_performance()
+        test_sanitization_long_inputs()
+        test_drop_oldest_keeps_drain_markers()
+
+        with shared_loggers() as (process_logger, single_logger):
+            test_ccglm_logger(process_logger)
+            test_multi_process_logging(process_logger, single_logger)
+            test_queue_performance(single_logger)
 
         print("\n🎉 All logging tests passed!")
         return 0
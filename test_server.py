@@ -83,6 +83,55 @@ async def test_file_tracking():
     # Check if file is in new_files (may have ./ prefix)
     assert any(test_file in f for f in new_files), f"Should detect {test_file}"
 
+    # Escaneo por mtime: un archivo existente editado no cuenta como creado,
+    # tanto con listado previo explícito como con el de la caché
+    import tempfile
+    import time
+    from ccglm_mcp_server import scan_new_files_since, snapshot_dir_listings
+    for use_snapshot in (True, False):
+        with tempfile.TemporaryDirectory() as tmp:
+            existing = os.path.join(tmp, "existing.py")
+            with open(existing, "w") as f:
+                f.write("a = 1\n")
+            # mtime antiguo: el listado del directorio entra en la caché
+            old_ns = time.time_ns() - 10_000_000_000
+            os.utime(tmp, ns=(old_ns, old_ns))
+            since_ns = time.time_ns()
+            before = snapshot_dir_listings(tmp, since_ns)
+            with open(existing, "a") as f:
+                f.write("b = 2\n")
+            created = os.path.join(tmp, "new.py")
+            with open(created, "w") as f:
+                f.write("c = 3\n")
+            found = scan_new_files_since(tmp, since_ns, before if use_snapshot else None)
+            print(f"Scan (snapshot={use_snapshot}): {sorted(found)}")
+            assert list(found) == [created], f"Only {created} should be reported"
+
+            # Llamadas Write de la salida: solo rutas dentro del directorio y
+            # escritas durante la ejecución
+            from ccglm_mcp_server import files_from_tool_output
+            output = "call Write(existing.py) Write(new.py) Write(/etc/hostname) Write(../x.py)"
+            if use_snapshot:
+                reported = files_from_tool_output(tmp, time.time_ns(), output)
+                assert not reported, "Files not written during the run should be ignored"
+            reported = files_from_tool_output(tmp, since_ns, output)
+            assert set(reported) <= {existing, created}, f"Paths outside {tmp} should be ignored"
+
+    # El listado previo se toma mientras el proceso ya escribe: un archivo
+    # creado antes de que el recorrido llegue a su directorio sigue siendo nuevo
+    with tempfile.TemporaryDirectory() as tmp:
+        old_ns = time.time_ns() - 10_000_000_000
+        os.utime(tmp, ns=(old_ns, old_ns))
+        since_ns = time.time_ns()
+        time.sleep(0.05)  # Margen por la resolución del reloj del mtime
+        created = os.path.join(tmp, "early.py")
+        with open(created, "w") as f:
+            f.write("d = 4\n")
+        before = snapshot_dir_listings(tmp, since_ns)
+        found = scan_new_files_since(tmp, since_ns, before)
+        print(f"Scan (file created before snapshot): {sorted(found)}")
+        assert list(found) == [created], f"{created} should be reported"
+
     print("✅ Test 3 PASSED\n")
 
 
@@ -92,7 +141,7 @@ async def test_sanitization():
     print("TEST 4: Log Sanitization")
     print("=" * 60)
 
-    from ccglm_mcp_server import sanitize_for_log, GLM_AUTH_TOKEN
+    from ccglm_mcp_server import sanitize_for_log, sanitize_bytes, GLM_AUTH_TOKEN
 
     test_text = f"Error: Authentication failed with token {GLM_AUTH_TOKEN}"
     sanitized = sanitize_for_log(test_text)
@@ -103,6 +152,25 @@ async def test_sanitization():
     assert GLM_AUTH_TOKEN not in sanitized, "Token should be redacted"
     assert "***REDACTED***" in sanitized, "Should contain redaction marker"
 
+    # Salida cruda del subprocess: se sanitiza antes de decodificar
+    sanitized_bytes = sanitize_bytes(test_text.encode("utf-8"))
+    assert sanitized_bytes.decode("utf-8") == sanitized, "Bytes and text sanitization should match"
+
+    # stderr acotado: el token partido entre bloques o en el borde del
+    # recorte no debe filtrarse, y se conserva el final de la salida
+    from ccglm_mcp_server import read_stream_tail
+    token = GLM_AUTH_TOKEN.encode("utf-8")
+    raw = b"x" * 4084 + b"tok " + token + b" " + b"y" * 100 + b"\nError: real cause"
+    for split in (4090, 4088 + len(token) // 2):
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw[:split])
+        reader.feed_data(raw[split:])
+        reader.feed_eof()
+        tail = await read_stream_tail(reader, 4096)
+        assert len(tail) <= 4096, "Tail should be capped"
+        assert tail.endswith(b"Error: real cause"), "Tail should keep the end of stderr"
+        assert token[:4] not in tail, "No part of the token should survive truncation"
+
     print("✅ Test 4 PASSED\n")
 
 
@@ -7,17 +7,45 @@ Verifica que todos los componentes estén configurados correctamente
 import json
 import sys
 import os
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+SERVER_FILE = '/home/manu/IA/ccglm-mcp/ccglm_mcp_server.py'
+SETTINGS_FILE = '/home/manu/.claude/settings.json'
+REGISTRY_FILE = '/home/manu/.claude/agents/hashtag-registry.json'
+
+
+@lru_cache(maxsize=None)
+def read_text(path: str) -> str:
+    """Lee un archivo una sola vez por ejecución"""
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def prefetch(paths) -> None:
+    """Lee en paralelo los archivos que usarán los checks
+
+    Los checks siguen ejecutándose en orden para no mezclar su salida;
+    aquí solo se solapan las lecturas. Los errores se ignoran: el check
+    correspondiente vuelve a leer y los informa.
+    """
+    def warm(path):
+        try:
+            read_text(path)
+        except OSError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        list(pool.map(warm, paths))
+
 def check_timeout_sync():
     """Verifica que los timeouts estén sincronizados"""
     print("🔧 Checking timeout synchronization...")
 
     # Leer settings.json
     try:
-        with open('/home/manu/.claude/settings.json', 'r') as f:
-            settings = json.load(f)
+        settings = json.loads(read_text(SETTINGS_FILE))
 
         mcp_timeout = settings['mcpServers']['ccglm-mcp']['timeout']
         expected_timeout = 300000  # 5 minutos en milisegundos
@@ -37,11 +65,8 @@ def check_server_code():
     """Verifica que el código del servidor tenga las correcciones"""
     print("\n🔍 Checking server code modifications...")
 
-    server_file = '/home/manu/IA/ccglm-mcp/ccglm_mcp_server.py'
-
     try:
-        with open(server_file, 'r') as f:
-            content = f.read()
+        content = read_text(SERVER_FILE)
 
         checks = [
             ("MODEL DEBUG logging", "🎯 MODEL DEBUG: Requested=" in content),
@@ -71,8 +96,7 @@ def check_hashtag_registry():
     print("\n🏷️  Checking hashtag registry...")
 
     try:
-        with open('/home/manu/.claude/agents/hashtag-registry.json', 'r') as f:
-            registry = json.load(f)
+        registry = json.loads(read_text(REGISTRY_FILE))
 
         mappings = registry['hashtag_mappings']
 
@@ -118,17 +142,15 @@ def run_syntax_check():
     print("\n🐍 Checking Python syntax...")
 
     try:
-        result = subprocess.run([
-            sys.executable, '-m', 'py_compile',
-            '/home/manu/IA/ccglm-mcp/ccglm_mcp_server.py'
-        ], capture_output=True, text=True)
-
-        if result.returncode == 0:
-            print("✅ Server code syntax is valid")
-            return True
-        else:
-            print(f"❌ Syntax errors found: {result.stderr}")
-            return False
+        # Compilar en el propio proceso: misma comprobación que py_compile
+        # sin arrancar otro intérprete
+        compile(read_text(SERVER_FILE), SERVER_FILE, 'exec')
+        print("✅ Server code syntax is valid")
+        return True
+
+    except SyntaxError as e:
+        print(f"❌ Syntax errors found: {e}")
+        return False
 
     except Exception as e:
         print(f"❌ Error checking syntax: {e}")
@@ -147,6 +169,8 @@ def main():
         ("Python Syntax Check", run_syntax_check)
     ]
 
+    prefetch((SETTINGS_FILE, SERVER_FILE, REGISTRY_FILE))
+
     results = []
     for check_name, check_func in checks:
         try: